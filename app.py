@@ -4,11 +4,23 @@ MatrixRain Flask Backend Server
 Serves as RSS proxy to avoid CORS issues
 """
 
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
+import orjson
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from lxml import etree as LET
+import atexit
+import functools
 import json
+import multiprocessing
 import os
+import threading
+import time
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from flask_cors import CORS
 
@@ -19,19 +31,75 @@ CORS(app)  # Enable CORS for all routes
 rss_cache = {
     'data': None,
     'timestamp': None,
-    'count': 0
+    'mono': None,
+    'count': 0,
+    'payload': None,
+    'etag': None
 }
 
-# Cache TTL in seconds (5 minutes)
+# Cache TTL in seconds (5 minutes), measured on the monotonic clock
 CACHE_TTL = 300
 
+# Guards rss_cache; only ever held for short reads/writes, never across network I/O
+_cache_lock = threading.RLock()
+
+# Single-flight refresh: the leader fills in _refresh_future and every other
+# request (or the stale path) waits on or skips that same refresh
+_refresh_guard = threading.Lock()
+_refresh_future = None
+
+# Per-feed cache keyed by URL: parsed texts plus the HTTP validators
+# (ETag, Last-Modified) of the response they came from, so a refresh only
+# refetches expired feeds and can revalidate them with a conditional GET
+per_feed_cache = {}
+
+# Lenient libxml2 parser: broken feeds still yield items, entities are not expanded
+XML_PARSE_OPTIONS = {'recover': True, 'huge_tree': False, 'resolve_entities': False}
+
+# Largest feed body accepted (bytes); anything bigger is skipped unparsed
+MAX_FEED_BYTES = 2_000_000
+
+# Feed bodies at least this large (bytes) are parsed in the parse pool; smaller
+# ones parse faster in-thread than the round trip to a worker process costs
+PARSE_OFFLOAD_BYTES = 256_000
+
+# Parse processes per server process (each gunicorn worker gets its own pool,
+# so keep this small); override with the PARSE_WORKERS environment variable
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 2))
+
+# Worker processes so large feeds parse off the GIL. Created on first use:
+# parse processes re-import this module and must not build pools of their own.
+# Avoid plain fork: the server process is multi-threaded by the time it is used.
+_mp_context = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+# Maximum number of feeds fetched in parallel
+FETCH_WORKERS = 64
+
+# Shared HTTP session so feed fetches reuse pooled keep-alive connections
+SESSION = requests.Session()
+# Advertise every encoding urllib3 can decode here (br once brotli is installed)
+SESSION.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'User-Agent': 'MatrixRain/1.0'})
+_adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS,
+                       max_retries=Retry(total=2, backoff_factor=0.2))
+SESSION.mount('http://', _adapter)
+SESSION.mount('https://', _adapter)
+
+# Parsed feed list, cached only on success; reload via /api/feeds/reload
+@functools.lru_cache(maxsize=1)
+def _read_rss_feeds():
+    """Read RSS feed URLs from JSON file, raising if it is missing or invalid"""
+    with open('rss_feeds.json', 'r') as f:
+        data = json.load(f)
+        return data.get('feeds', [])
+
 # Load RSS feeds from JSON file
 def load_rss_feeds():
     """Load RSS feed URLs from JSON file"""
     try:
-        with open('rss_feeds.json', 'r') as f:
-            data = json.load(f)
-            return data.get('feeds', [])
+        return _read_rss_feeds()
     except FileNotFoundError:
         print("Warning: rss_feeds.json not found")
         return []
@@ -39,132 +107,333 @@ def load_rss_feeds():
         print("Error: Invalid JSON in rss_feeds.json")
         return []
 
-def is_cache_valid():
-    """Check if cached RSS data is still valid"""
-    if rss_cache['data'] is None or rss_cache['timestamp'] is None:
+def is_cache_valid(now=None):
+    """Check if cached RSS data is still valid at monotonic time `now` (default: current)"""
+    if rss_cache['data'] is None or rss_cache['mono'] is None:
+        return False
+
+    if now is None:
+        now = time.monotonic()
+    return now - rss_cache['mono'] < CACHE_TTL
+
+def is_feed_cache_valid(entry, now=None):
+    """Check if a per_feed_cache entry is still valid at monotonic time `now`"""
+    if entry is None:
         return False
 
-    cache_age = datetime.now() - rss_cache['timestamp']
-    return cache_age.total_seconds() < CACHE_TTL
+    if now is None:
+        now = time.monotonic()
+    return now - entry['mono'] < CACHE_TTL
 
-def get_cached_rss_content():
-    """Return cached RSS content if valid"""
-    if is_cache_valid():
+def get_cached_rss_content(now=None):
+    """Return the pre-serialized cached RSS response if valid, or a 304 if the client has it"""
+    if now is None:
+        now = time.monotonic()
+    if not is_cache_valid(now):
+        return None
+
+    if request.if_none_match.contains_weak(rss_cache['etag']):
+        print(f"📋 Client already has cached RSS data ({rss_cache['count']} texts)")
+        response = Response(status=304)
+    else:
         print(f"📋 Using cached RSS data ({rss_cache['count']} texts, {CACHE_TTL}s TTL)")
-        return {
-            'texts': rss_cache['data'],
-            'count': rss_cache['count'],
+        response = Response(rss_cache['payload'], mimetype='application/json')
+
+    # Let browsers/CDNs reuse the response until this cache entry expires
+    remaining_ttl = min(CACHE_TTL, max(0, int(CACHE_TTL - (now - rss_cache['mono']))))
+    response.set_etag(rss_cache['etag'], weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = remaining_ttl
+    return response
+
+def update_rss_cache(texts, fetched_at=None):
+    """Update the RSS cache with new data fetched at `fetched_at` (wall clock)"""
+    with _cache_lock:
+        rss_cache['data'] = texts
+        rss_cache['timestamp'] = fetched_at or datetime.now()
+        rss_cache['mono'] = time.monotonic()
+        rss_cache['count'] = len(texts)
+        rss_cache['etag'] = f"{len(texts)}-{int(rss_cache['mono'] * 1000)}"
+        # Serialize once here so cache hits only hand out the stored bytes
+        rss_cache['payload'] = orjson.dumps({
+            'texts': texts,
+            'count': len(texts),
             'timestamp': rss_cache['timestamp'].isoformat(),
             'cached': True
-        }
-    return None
-
-def update_rss_cache(texts):
-    """Update the RSS cache with new data"""
-    rss_cache['data'] = texts
-    rss_cache['timestamp'] = datetime.now()
-    rss_cache['count'] = len(texts)
+        })
     print(f"💾 Updated RSS cache with {len(texts)} texts")
 
-def parse_rss_content(xml_text):
-    """Parse RSS XML and extract titles and descriptions"""
-    try:
-        root = ET.fromstring(xml_text)
-        items = root.findall('.//item')
-        content = []
+def reset_rss_cache():
+    """Drop the joined RSS cache so the next request rebuilds it"""
+    with _cache_lock:
+        rss_cache['data'] = None
+        rss_cache['timestamp'] = None
+        rss_cache['mono'] = None
+        rss_cache['count'] = 0
+        rss_cache['payload'] = None
+        rss_cache['etag'] = None
 
-        for item in items:
-            title_elem = item.find('title')
-            desc_elem = item.find('description')
+def parse_rss_content(xml_bytes):
+    """Stream-parse raw RSS XML bytes and extract titles and descriptions"""
+    try:
+        items = LET.iterparse(BytesIO(xml_bytes), events=('end',), tag='item',
+                              **XML_PARSE_OPTIONS)
+        parts = []
+        # Bind hot-loop lookups to locals once instead of per item
+        append = parts.append
+        findtext = LET._Element.findtext
 
-            title = title_elem.text.strip() if title_elem is not None and title_elem.text else ''
-            description = desc_elem.text.strip() if desc_elem is not None and desc_elem.text else ''
+        for _, item in items:
+            title = (findtext(item, 'title') or '').strip()
+            description = (findtext(item, 'description') or '').strip()
 
             if title:
-                content.append(title.upper())
+                append(title)
             if description:
-                content.append(description.upper())
+                append(description)
 
+            # Drop the finished item and its preceding siblings to keep memory flat
+            item.clear()
+            while item.getprevious() is not None:
+                del item.getparent()[0]
+
+        if not parts:
+            return []
+
+        # Uppercase everything in one pass over a single \x1f-joined buffer
+        content = '\x1f'.join(parts).upper().split('\x1f')
+        if len(content) != len(parts):
+            # A recovered feed smuggled \x1f into its text; fall back per string
+            content = [part.upper() for part in parts]
         return content
-    except ET.ParseError as e:
+    except LET.XMLSyntaxError as e:
         print(f"Error parsing RSS XML: {e}")
         return []
 
-@app.route('/api/rss')
-def get_rss_content():
-    """Fetch and parse RSS feeds with caching, return as JSON"""
+def get_parse_pool():
+    """Return the shared parse process pool, creating it on first use"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=_mp_context)
+            atexit.register(_parse_pool.shutdown)
+        return _parse_pool
+
+def _parse_feed_body(body):
+    """Parse a feed body, offloading large documents to the parse process pool"""
+    if len(body) < PARSE_OFFLOAD_BYTES:
+        return parse_rss_content(body)
+    try:
+        return get_parse_pool().submit(parse_rss_content, body).result()
+    except BrokenProcessPool:
+        return parse_rss_content(body)
+
+def _read_feed_body(feed_url, response):
+    """Read a streamed feed response, or return None if it is not XML or too large"""
+    content_type = response.headers.get('Content-Type', '').lower()
+    if content_type and 'xml' not in content_type and not content_type.startswith('application/'):
+        print(f"Skipping {feed_url}: unexpected content type {content_type}")
+        return None
+
+    if int(response.headers.get('Content-Length') or 0) > MAX_FEED_BYTES:
+        print(f"Skipping {feed_url}: Content-Length over {MAX_FEED_BYTES} bytes")
+        return None
 
-    # Check cache first
-    cached_data = get_cached_rss_content()
-    if cached_data:
-        return jsonify(cached_data)
+    # Count decoded bytes so compressed responses cannot inflate past the cap
+    body = bytearray()
+    for chunk in response.iter_content(chunk_size=65536):
+        body += chunk
+        if len(body) > MAX_FEED_BYTES:
+            print(f"Skipping {feed_url}: body over {MAX_FEED_BYTES} bytes")
+            return None
+    return bytes(body)
 
-    # Cache miss - fetch fresh data
-    print("🔄 Cache miss - fetching fresh RSS data...")
+def _fetch_one(feed_url, now=None):
+    """Return cached texts for a feed, or fetch and parse it (url, content or None)"""
+    # Read the entry once; /api/cache/clear may empty the dict mid-refresh
+    entry = per_feed_cache.get(feed_url)
+    if is_feed_cache_valid(entry, now):
+        return feed_url, entry['texts']
+
+    try:
+        print(f"Fetching RSS feed: {feed_url}")
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with SESSION.get(feed_url, timeout=10, headers=headers, stream=True) as response:
+            if entry is not None and response.status_code == 304:
+                entry['mono'] = time.monotonic()
+                content = entry['texts']
+                print(f"Unchanged, reusing {len(content)} texts from {feed_url}")
+                return feed_url, content
+            response.raise_for_status()
+
+            body = _read_feed_body(feed_url, response)
+            if body is None:
+                return feed_url, None
+
+        content = _parse_feed_body(body)
+        per_feed_cache[feed_url] = {
+            'texts': content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'mono': time.monotonic()
+        }
+        print(f"Loaded {len(content)} texts from {feed_url}")
+        return feed_url, content
+
+    except requests.RequestException as e:
+        print(f"Failed to fetch {feed_url}: {e}")
+        return feed_url, None
+    except Exception as e:
+        print(f"Error processing {feed_url}: {e}")
+        return feed_url, None
+
+def refresh_rss_cache():
+    """Fetch expired feeds, rebuild the joined texts and update the cache
+
+    Returns the texts and the time the refresh completed.
+    """
     rss_feeds = load_rss_feeds()
     all_content = []
 
-    for feed_url in rss_feeds:
-        try:
-            print(f"Fetching RSS feed: {feed_url}")
-            response = requests.get(feed_url, timeout=10)
-            response.raise_for_status()
+    # Keep every feed in flight at once so refresh time tracks the slowest feed
+    workers = max(1, min(FETCH_WORKERS, len(rss_feeds)))
+    fetch_one = functools.partial(_fetch_one, now=time.monotonic())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fetch_one, rss_feeds))
 
-            content = parse_rss_content(response.text)
+    for feed_url, content in results:
+        if content:
             all_content.extend(content)
 
-            print(f"Loaded {len(content)} texts from {feed_url}")
-
-        except requests.RequestException as e:
-            print(f"Failed to fetch {feed_url}: {e}")
-            continue
-        except Exception as e:
-            print(f"Error processing {feed_url}: {e}")
-            continue
+    # Drop repeated texts (shared taglines, categories) keeping first-seen order
+    all_content = list(dict.fromkeys(all_content))
 
     # Update cache with fresh data
+    fetched_at = datetime.now()
     if all_content:
-        update_rss_cache(all_content)
+        update_rss_cache(all_content, fetched_at)
 
-    return jsonify({
+    return all_content, fetched_at
+
+def _join_refresh():
+    """Return (future, is_leader) for the in-flight refresh, claiming it if none runs"""
+    global _refresh_future
+    with _refresh_guard:
+        if _refresh_future is not None:
+            return _refresh_future, False
+        _refresh_future = Future()
+        return _refresh_future, True
+
+def _run_refresh(future):
+    """Run the refresh as leader and publish its result (even if empty) to waiters"""
+    global _refresh_future
+    try:
+        future.set_result(refresh_rss_cache())
+    except Exception as e:
+        print(f"RSS refresh failed: {e}")
+        future.set_exception(e)
+    finally:
+        with _refresh_guard:
+            _refresh_future = None
+
+@app.route('/api/rss')
+def get_rss_content():
+    """Fetch and parse RSS feeds with caching, return as JSON"""
+    with _cache_lock:
+        # Read the clock under the lock so it can't predate rss_cache['mono']
+        now = time.monotonic()
+        # Check cache first
+        cached_response = get_cached_rss_content(now)
+        if cached_response:
+            return cached_response
+
+        stale_response = None
+        if rss_cache['data'] is not None:
+            stale_response = Response(orjson.dumps({
+                'texts': rss_cache['data'],
+                'count': rss_cache['count'],
+                'timestamp': rss_cache['timestamp'].isoformat(),
+                'cached': True,
+                'stale': True
+            }), mimetype='application/json')
+            stale_count = rss_cache['count']
+
+    future, is_leader = _join_refresh()
+
+    # Stale data - serve it now and let one background thread refresh it
+    if stale_response is not None:
+        if is_leader:
+            threading.Thread(target=_run_refresh, args=(future,), daemon=True).start()
+        print(f"⏳ Serving stale RSS data ({stale_count} texts) while refreshing")
+        # Fresh data is on its way; clients must not hold on to this copy
+        stale_response.cache_control.no_cache = True
+        return stale_response
+
+    # Cold cache - one request fetches, concurrent ones wait for its result
+    if is_leader:
+        print("🔄 Cache miss - fetching fresh RSS data...")
+        _run_refresh(future)
+    else:
+        print("🔄 Cache miss - waiting for in-flight RSS refresh...")
+    all_content, fetched_at = future.result()
+
+    with _cache_lock:
+        etag = rss_cache['etag'] if all_content else None
+
+    response = Response(orjson.dumps({
         'texts': all_content,
         'count': len(all_content),
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': fetched_at.isoformat(),
         'cached': False
-    })
+    }), mimetype='application/json')
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_TTL
+    else:
+        # Nothing was cached, so let the next request retry the feeds
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/api/cache/status')
 def get_cache_status():
     """Get cache status information"""
-    if rss_cache['timestamp']:
-        cache_age = datetime.now() - rss_cache['timestamp']
-        age_seconds = int(cache_age.total_seconds())
-        remaining_ttl = max(0, CACHE_TTL - age_seconds)
-
-        return jsonify({
-            'cached': is_cache_valid(),
-            'count': rss_cache['count'],
-            'timestamp': rss_cache['timestamp'].isoformat(),
-            'age_seconds': age_seconds,
-            'ttl_seconds': CACHE_TTL,
-            'remaining_ttl': remaining_ttl
-        })
-    else:
-        return jsonify({
-            'cached': False,
-            'count': 0,
-            'timestamp': None,
-            'age_seconds': None,
-            'ttl_seconds': CACHE_TTL,
-            'remaining_ttl': 0
-        })
+    with _cache_lock:
+        now = time.monotonic()
+        if rss_cache['timestamp']:
+            age_seconds = max(0, int(now - rss_cache['mono']))
+            remaining_ttl = max(0, CACHE_TTL - age_seconds)
+
+            return jsonify({
+                'cached': is_cache_valid(now),
+                'count': rss_cache['count'],
+                'timestamp': rss_cache['timestamp'].isoformat(),
+                'age_seconds': age_seconds,
+                'ttl_seconds': CACHE_TTL,
+                'remaining_ttl': remaining_ttl
+            })
+        else:
+            return jsonify({
+                'cached': False,
+                'count': 0,
+                'timestamp': None,
+                'age_seconds': None,
+                'ttl_seconds': CACHE_TTL,
+                'remaining_ttl': 0
+            })
 
 @app.route('/api/cache/clear')
 def clear_cache():
     """Clear RSS cache (for debugging)"""
-    rss_cache['data'] = None
-    rss_cache['timestamp'] = None
-    rss_cache['count'] = 0
+    with _cache_lock:
+        reset_rss_cache()
+        per_feed_cache.clear()
     print("🗑️  RSS cache cleared")
 
     return jsonify({
@@ -172,6 +441,25 @@ def clear_cache():
         'message': 'RSS cache has been cleared'
     })
 
+@app.route('/api/feeds/reload')
+def reload_feeds():
+    """Reload RSS feed URLs from rss_feeds.json"""
+    _read_rss_feeds.cache_clear()
+    feeds = load_rss_feeds()
+
+    with _cache_lock:
+        # Rebuild the joined texts from the new list on the next /api/rss;
+        # still-fresh feeds come from the per-feed cache, removed ones are dropped
+        reset_rss_cache()
+        for feed_url in set(per_feed_cache) - set(feeds):
+            per_feed_cache.pop(feed_url, None)
+    print(f"🔁 Reloaded {len(feeds)} RSS feeds from rss_feeds.json")
+
+    return jsonify({
+        'status': 'feeds_reloaded',
+        'count': len(feeds)
+    })
+
 @app.route('/')
 def serve_index():
     """Serve the main HTML file"""
@@ -187,6 +475,7 @@ if __name__ == '__main__':
     print("📋 RSS API available at: http://localhost:5000/api/rss")
     print("🔍 Cache status API: http://localhost:5000/api/cache/status")
     print("🗑️  Cache clear API: http://localhost:5000/api/cache/clear")
+    print("🔁 Feeds reload API: http://localhost:5000/api/feeds/reload")
     print("🌐 Frontend available at: http://localhost:5000")
     print(f"💾 RSS cache TTL: {CACHE_TTL} seconds ({CACHE_TTL//60} minutes)")
     print("=" * 60)
@@ -5,11 +5,48 @@ Tests all RSS feeds in rss_feeds.json and reports which ones work/fail
 """
 
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from lxml import etree as LET
 import json
+import threading
 import time
 import sys
+from io import BytesIO
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlparse
+
+# Maximum number of feeds tested in parallel
+TEST_WORKERS = 64
+
+# Minimum delay between requests to the same host, to be respectful to servers
+HOST_MIN_INTERVAL = 0.1
+
+# Next free request slot per host; distinct hosts are never delayed
+_host_next_slot = defaultdict(float)
+_host_lock = threading.Lock()
+
+# Same lenient parser options as app.py, so results reflect what the server accepts
+XML_PARSE_OPTIONS = {'recover': True, 'huge_tree': False, 'resolve_entities': False}
+
+# Root and descendant element names that identify a document as a feed;
+# kept un-namespaced to match what app.parse_rss_content can read
+FEED_ROOT_TAGS = ('rss', 'feed')
+FEED_TAGS = ('channel', 'item')
+
+# Give up looking for a feed element after this many elements
+MAX_SNIFF_ELEMENTS = 200
+
+# Byte markers, one of which should appear near the start of any RSS/Atom/RDF feed
+FEED_MARKERS = (b'<rss', b'<feed', b'<rdf', b'<?xml')
+
+# Shared HTTP session so feed tests reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': 'MatrixRain-RSS-Checker/1.0'})
+_adapter = HTTPAdapter(pool_connections=TEST_WORKERS, pool_maxsize=TEST_WORKERS)
+SESSION.mount('http://', _adapter)
+SESSION.mount('https://', _adapter)
 
 def load_rss_feeds():
     """Load RSS feed URLs from JSON file"""
@@ -24,15 +61,24 @@ def load_rss_feeds():
         print("❌ Error: Invalid JSON in rss_feeds.json")
         return []
 
+def wait_for_host(url):
+    """Sleep until this URL's host may be contacted again"""
+    host = urlparse(url).netloc
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_next_slot[host])
+        _host_next_slot[host] = slot + HOST_MIN_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
 def test_rss_feed(url, timeout=10):
     """Test a single RSS feed URL"""
+    wait_for_host(url)
     start_time = time.time()
 
     try:
         # Try to fetch the RSS feed
-        response = requests.get(url, timeout=timeout, headers={
-            'User-Agent': 'MatrixRain-RSS-Checker/1.0'
-        })
+        response = SESSION.get(url, timeout=timeout)
         response_time = time.time() - start_time
 
         if response.status_code != 200:
@@ -43,27 +89,39 @@ def test_rss_feed(url, timeout=10):
                 'response_time': response_time
             }
 
-        # Try to parse the XML
+        # Cheap sniff so HTML pages and other junk skip the XML parse entirely
+        head = response.content[:2048].lower()
+        if not any(marker in head for marker in FEED_MARKERS):
+            return {
+                'url': url,
+                'status': 'INVALID_XML',
+                'error': 'No RSS/feed markup at start of document',
+                'response_time': response_time
+            }
+
+        # Parse only until the first feed element; no need to build the whole tree
         try:
-            root = ET.fromstring(response.text)
-
-            # Check if it has RSS structure
-            if root.tag in ['rss', 'feed'] or root.find('.//channel') or root.find('.//item'):
-                return {
-                    'url': url,
-                    'status': 'SUCCESS',
-                    'response_time': response_time,
-                    'content_length': len(response.text)
-                }
-            else:
-                return {
-                    'url': url,
-                    'status': 'INVALID_XML',
-                    'error': 'No RSS/feed structure found',
-                    'response_time': response_time
-                }
-
-        except ET.ParseError as e:
+            elements = LET.iterparse(BytesIO(response.content), events=('start',),
+                                     **XML_PARSE_OPTIONS)
+            for count, (_, elem) in enumerate(elements, 1):
+                if elem.tag in FEED_TAGS or (count == 1 and elem.tag in FEED_ROOT_TAGS):
+                    return {
+                        'url': url,
+                        'status': 'SUCCESS',
+                        'response_time': response_time,
+                        'content_length': len(response.content)
+                    }
+                if count >= MAX_SNIFF_ELEMENTS:
+                    break
+
+            return {
+                'url': url,
+                'status': 'INVALID_XML',
+                'error': 'No RSS/feed structure found',
+                'response_time': response_time
+            }
+
+        except LET.XMLSyntaxError as e:
             return {
                 'url': url,
                 'status': 'PARSE_ERROR',
@@ -106,23 +164,23 @@ def main():
     working_count = 0
     total_response_time = 0
 
-    # Test each feed
-    for i, url in enumerate(feeds, 1):
+    # Test all feeds in parallel, then report in order
+    workers = min(TEST_WORKERS, len(feeds))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        feed_results = list(executor.map(test_rss_feed, feeds))
+
+    for i, (url, result) in enumerate(zip(feeds, feed_results), 1):
         print("Testing {:2d}/{:2d}: {}".format(i, len(feeds), url))
 
-        result = test_rss_feed(url)
         results[result['status']].append(result)
 
         if result['status'] == 'SUCCESS':
             working_count += 1
             total_response_time += result['response_time']
-            print("  ✅ SUCCESS ({:.2f}s, {} chars)".format(result['response_time'], result['content_length']))
+            print("  ✅ SUCCESS ({:.2f}s, {} bytes)".format(result['response_time'], result['content_length']))
         else:
             print("  ❌ {}: {}".format(result['status'], result['error'][:60]))
 
-        # Small delay to be respectful to servers
-        time.sleep(0.1)
-
     # Print summary
     print()
     print("📊 SUMMARY RESULTS")